@@ -28,9 +28,10 @@
 import asyncio
 import pathlib
 import time
+import sys
 import os
 
-from ..utils import callerframe, callerpath
+from ..utils import callerpath
 
 
 def sonic_py(resource_dir='.'):
@@ -128,6 +129,20 @@ dtd = {}
 syd = {}
 
 
+def _get_caller_key(frame):
+    """Get the key under which the state of the calling function is kept.
+    
+    The key is the id of the caller's code object, which is cheap to compute
+    and stays the same across iterations of a live loop.
+    """
+    cc = frame.f_code
+
+    if cc.co_name in ['<module>', 'async-def-wrapper']:
+        return '<module>'
+
+    return id(cc)
+
+
 def use(sound, **kwargs):
     """Set the instrument to use in subsequent calls to :func:`play`.
     
@@ -142,13 +157,7 @@ def use(sound, **kwargs):
     if kwargs:
         sound = sound.copy().set(**kwargs)
 
-    cf = callerframe()
-    cn = cf.f_code.co_name
-
-    if cn in ['<module>', 'async-def-wrapper']:
-        hh = '<module>'
-    else:
-        hh = hash(cf) 
+    hh = _get_caller_key(sys._getframe(1))
 
     syd[hh] = sound
 
@@ -170,13 +179,7 @@ def play(note, duration=None, **kwargs):
         **kwargs: Properties of intrument to modify.
     """
 
-    cf = callerframe()
-    cn = cf.f_code.co_name
-    
-    if cn in ['<module>', 'async-def-wrapper']:
-        hh = '<module>'
-    else:
-        hh = hash(cf) 
+    hh = _get_caller_key(sys._getframe(1))
 
     sy = syd[hh]
     
@@ -212,13 +215,7 @@ def sleep(duration=0):
     tt = get_time()
     dt = duration
 
-    cf = callerframe()
-    cn = cf.f_code.co_name
-
-    if cn in ['<module>', 'async-def-wrapper']:
-        hh = '<module>'
-    else:
-        hh = hash(cf) 
+    hh = _get_caller_key(sys._getframe(1))
 
     #sy = syd.get(hh)
     #if sy is not None:
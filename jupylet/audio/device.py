@@ -25,15 +25,16 @@
 """
 
 
+import collections
+import threading
+import functools
 import platform
-import _thread
 import logging
 import queue
 import copy
 import time
+import os
 
-import skimage.draw
-import scipy.signal
 import PIL.Image
 
 try:
@@ -76,8 +77,46 @@ def _init_worker_thread():
     global _worker_tid
     
     if not _worker_tid and sd is not None:
-        _worker_tid = _thread.start_new_thread(_start_sound_stream, ())
-        
+        _worker_tid = _spawn_audio_thread()
+
+
+def _spawn_audio_thread():
+
+    t = threading.Thread(target=_start_sound_stream, name='jupylet-audio', daemon=True)
+    t.start()
+
+    return t.ident
+
+
+#
+# The stream callback runs on a thread created by the sound device library.
+# Its priority is raised the first time it is called on a given thread, to
+# make buffer underruns less likely.
+#
+_rt_threads = set()
+
+
+def _raise_thread_priority():
+    """Try to raise the scheduling priority of the calling thread."""
+
+    try:
+        if platform.system() == 'Windows':
+            import ctypes
+            k32 = ctypes.windll.kernel32
+            THREAD_PRIORITY_TIME_CRITICAL = 15
+            return bool(k32.SetThreadPriority(k32.GetCurrentThread(), THREAD_PRIORITY_TIME_CRITICAL))
+
+        if platform.system() == 'Linux':
+            priority = os.sched_get_priority_min(os.SCHED_FIFO)
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            return True
+
+    except (AttributeError, OSError):
+        pass
+
+    return False
+
+
 #
 # This queue is only used to keep the sound stream running.
 #
@@ -136,29 +175,88 @@ def _set_stream_params(**kwargs):
     _workerq.put(1)
 
 
-_al_seconds = 1
-_al = []
+#
+# The output sent to the sound device is kept in a preallocated ring buffer
+# for the oscilloscope and for recording. _al_frames counts the total number
+# of frames written into it.
+#
+_al = np.zeros((FPS, 2), dtype='float32')
+_al_frames = 0
 
 
-def start_recording(limit=60):
+def _al_resize(frames, keep=True):
+    """Replace the output ring buffer with a new one of the given length."""
 
-    global _al_seconds
     global _al
+    global _al_frames
+
+    a0 = _al_read(-frames) if keep else _al[:0]
+    a1 = np.zeros((frames, _al.shape[1]), dtype=_al.dtype)
+    a1[:len(a0)] = a0
+
+    _al = a1
+    _al_frames = len(a0)
     
-    _al_seconds = limit    
-    _al.clear()
+
+def _al_write(a0):
+
+    global _al_frames
+
+    # Bind the ring buffer and its frame count once, since _al_resize() may
+    # replace them from another thread while this runs in the audio thread.
+    al = _al
+    f0 = _al_frames
+
+    n = len(al)
+    a0 = a0[-n:]
+    i0 = (f0 + len(a0)) % n - len(a0)
+
+    if i0 >= 0:
+        al[i0:i0 + len(a0)] = a0
+    else:
+        al[i0:] = a0[:-i0]
+        al[:len(a0) + i0] = a0[-i0:]
+
+    # Do not overwrite the frame count of a replacement ring buffer.
+    if _al is al:
+        _al_frames = f0 + len(a0)
+
+
+def _al_read(start=None, end=None):
+    """Read frames from the output ring buffer, in order, sliced as if it 
+    was a plain array of the frames it currently holds."""
+
+    al = _al
+    f0 = _al_frames
+
+    n = len(al)
+    filled = min(f0, n)
+
+    s0, s1, _ = slice(start, end).indices(filled)
+    s1 = max(s0, s1)
+
+    i0 = (f0 - filled + s0) % n
+    i1 = i0 + s1 - s0
+
+    if i1 <= n:
+        return al[i0:i1]
+
+    return np.concatenate((al[i0:], al[:i1 - n]))
+
+
+def start_recording(limit=60):
+    _al_resize(int(limit * FPS), keep=False)
 
 
 def stop_recording():
 
-    global _al_seconds
+    a0 = np.array(_al_read())
+    _al_resize(FPS)
 
-    a0 = np.concatenate(_al)
-    _al_seconds = 1
     return a0
 
 
-_dt = []
+_dt = collections.deque(maxlen=256)
 _safety_event0 = 0
 
 
@@ -173,6 +271,11 @@ def _stream_callback(outdata, frames, _time, status):
     """
     global _safety_event0
 
+    if threading.get_ident() not in _rt_threads:
+        _rt_threads.add(threading.get_ident())
+        raised = _raise_thread_priority()
+        logger.info('Raised priority of sound stream thread: %r.', raised)
+
     t0 = time.time()
     dt = _time.outputBufferDacTime - _time.currentTime
 
@@ -187,31 +290,24 @@ def _stream_callback(outdata, frames, _time, status):
     # array into the output buffer.
     #
 
-    sounds = _get_sounds()
-    
-    if not sounds:
-        a0 = np.zeros_like(outdata)        
-    else: 
-        a0 = _mix_sounds(sounds, frames)
+    _update_sounds()
+    _mix_sounds(_sounds, outdata)
 
-    a0 = _apply_effects(_effects, a0)
+    # Effects may hold on to their input buffer, so they get a copy of it.
+    if _effects:
+        outdata[:] = _apply_effects(_effects, outdata.copy())
 
-    a0 = (a0 * _master_volume).clip(-1, 1)
+    np.multiply(outdata, _master_volume, out=outdata)
+    np.clip(outdata, -1, 1, out=outdata)
     
     if t0 < _safety_event0 + 1:
-        a0 *= max(0.01, min(1, t0 - _safety_event0))
-
-    outdata[:] = a0
+        outdata *= max(0.01, min(1, t0 - _safety_event0))
 
     # 
     # Aggregate the output data and timers for the oscilloscope.
     #
 
-    while len(_al) * frames > _al_seconds * FPS:
-        _al.pop(0)
-        _dt.pop(0)
-
-    _al.append(a0)
+    _al_write(outdata)
     _dt.append((
         t0, 
         frames, 
@@ -255,15 +351,17 @@ def set_effects(*effects):
 
 
 #
-# A list of all currently playing sound objects.
+# Sounds are handed to the audio thread through the _pending deque, which is
+# safe to append to and pop from concurrently without a lock. The _sounds 
+# list of currently playing sound objects is owned by the audio thread.
 #
-_sounds0 = []
-_sounds1 = []
+_pending = collections.deque()
+_sounds = []
 
 
 def stop_sound():
-    _sounds0.clear()
-    _sounds1.clear()
+    _pending.clear()
+    _sounds.clear()
 
 
 def add_sound(sound):
@@ -275,62 +373,63 @@ def add_sound(sound):
     if _worker_tid is None:
         _init_worker_thread()
 
-    _sounds0.append(sound)
+    _pending.append(sound)
 
          
-def _get_sounds():
-    """Get currently playing sound objects."""
-
-    sd = set()
-    sl = []
-
-    while _sounds0:
-        s = _sounds0.pop(0)
-        if s not in sd and not s.done:
-            sl.append(s)
-            sd.add(s)
+def _update_sounds():
+    """Add pending sounds to, and discard done sounds from, the list of 
+    currently playing sound objects."""
 
-    while _sounds1:
-        s = _sounds1.pop(0)
-        if s not in sd and not s.done:
-            sl.append(s)
-            sd.add(s)
+    while _pending:
+        s = _pending.popleft()
+        if s not in _sounds:
+            _sounds.append(s)
 
-    _sounds1[:] = sl
-
-    return sl
+    _sounds[:] = [s for s in _sounds if not s.done]
       
 
-def _mix_sounds(sounds, frames):
-    """Mix sound data from given sounds into a single numpy array.
+def _mix_sounds(sounds, out):
+    """Mix sound data from given sounds into the given output array.
 
     Args:
         sounds: Currently playing sound objects.
-        frames (int): Number of frames to consume from each sound object.
+        out (ndarray): Array to mix sound data into. The number of frames
+            to consume from each sound object is the length of this array.
 
     Returns:
-        ndarray
+        ndarray: The output array.
     """
+    out.fill(0)
+
     es = {}
 
     for s0 in sounds:
         el = s0.get_effects()
         es.setdefault(el, []).append(s0)
 
-    al = []
-
     for el, sl in es.items():
-        a0 = _mix_sounds0(sl, frames)
+
+        if not el:
+            _mix_sounds0(sl, out)
+            continue
+
+        # Effects may hold on to their input buffer, so sounds with effects
+        # are mixed into a new array.
+        a0 = _mix_sounds0(sl, np.zeros(out.shape))
         a0 = _apply_effects(el, a0)
-        al.append(a0)
+        np.add(out, a0, out=out)
         
-    return np.stack(al).sum(0)
+    return out
+
+
+def _mix_sounds0(sounds, out):
 
+    frames = len(out)
 
-def _mix_sounds0(sounds, frames):
+    for s in sounds:
+        np.add(out, s.consume(frames), out=out)
 
-    al = [s.consume(frames) for s in sounds]
-    return np.stack(al).sum(0)
+    return out
 
 
 def _apply_effects(effects, a):
@@ -392,7 +491,9 @@ def get_oscilloscope_as_array(
 
     Returns:
         ndarray, float, float: a 3-tuple with the oscilloscope array, and the 
-            timestamps of the leftmost and rightmost drawn samples.        
+            timestamps of the leftmost and rightmost drawn samples. The array 
+            is reused by subsequent calls for an oscilloscope of the same
+            size, so copy it if you need to keep it.
     """
     
     ms = min(ms, 256)
@@ -411,44 +512,98 @@ def get_oscilloscope_as_array(
     s1 = int((te - tend) * FPS)
     s0 = int((ts - tend) * FPS)
 
-    a0 = a0[s0: s1] * amp
-    a0 = a0.clip(-1., 1.)
+    a0 = a0[s0: s1]
 
     if len(a0) < 100:
         return np.zeros((h0, w0, 4), dtype='uint8'), 0, 0
 
-    a0 = scipy.signal.resample(a0, w0)
+    a0 = _resample(a0, w0)
 
-    a1 = np.arange(len(a0))
-    a2 = ((a0 + 1) * h0 / 2).clip(0, h0 - 1).astype(a1.dtype)
-    a3 = np.stack((a2, a1), -1)
+    np.multiply(a0, amp, out=a0)
+    np.clip(a0, -1., 1., out=a0)
 
-    a4 = np.concatenate((a3[:-1], a3[1:]), -1)
-    a5 = np.zeros((h0, w0, 4), dtype='uint8')
-    a5[...,:3] = color
+    a0 += 1.
+    a0 *= h0 / 2
+    np.clip(a0, 0, h0 - 1, out=a0)
+
+    a1 = a0.astype('int64')
+    a2 = np.append(a1[1:], a1[-1])
+
+    #
+    # Draw the wave as a polyline, by painting in each column the vertical 
+    # span of pixels between its sample and the sample of the next column.
+    #
+    a3 = np.minimum(a1, a2)
+    a4 = np.maximum(a1, a2)
+
+    yy, m0, m1, a5 = _get_oscilloscope_scratch(w0, h0)
+
+    np.greater_equal(yy, a3, out=m0)
+    np.less_equal(yy, a4, out=m1)
+    np.logical_and(m0, m1, out=m0)
 
-    for cc in a4:
-        y, x, c = skimage.draw.line_aa(*cc)
-        a5[y, x, -1] = c * 255
+    a5[...,:3] = color
+    a5[...,-1] = m0
+    a5[...,-1] *= 255
     
     return a5, ts, te
 
 
+_oscilloscope_scratch = {}
+
+
+def _get_oscilloscope_scratch(w0, h0):
+    """Get preallocated arrays for drawing an oscilloscope of given size."""
+
+    sb = _oscilloscope_scratch.get((w0, h0))
+
+    if sb is None:
+        sb = _oscilloscope_scratch[(w0, h0)] = (
+            np.arange(h0)[:, None],
+            np.zeros((h0, w0), dtype='bool'),
+            np.zeros((h0, w0), dtype='bool'),
+            np.zeros((h0, w0, 4), dtype='uint8'),
+        )
+
+    return sb
+
+
 def get_output_as_array(start=-FPS, end=None, resample=None):
 
-    if not _dt or not _al:
+    if not _dt or not _al_frames:
         return
 
     t0, st, _, da, ct = _dt[-1]
     t1 = t0 + da - ct + st / FPS
 
-    a0 = np.concatenate(_al).mean(-1)[start:end]
+    a0 = _al_read(start, end).mean(-1)
     
     tend = t1 + (end or 0) / FPS
     tstart = tend - len(a0) / FPS
 
     if resample:
-        a0 = scipy.signal.resample(a0, resample)
+        a0 = _resample(a0, resample)
     
     return a0, tstart, tend
 
+
+def _resample(a0, size):
+    """Resample 1D array to given size with linear interpolation.
+    
+    This is much cheaper than the FFT based scipy.signal.resample() and good
+    enough for display purposes.
+    """
+    x0, x1 = _get_resample_coordinates(len(a0), size)
+    return np.interp(x0, x1, a0)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_resample_coordinates(src_size, dst_size):
+
+    x0 = np.linspace(0, src_size - 1, dst_size)
+    x1 = np.arange(src_size)
+
+    x0.flags.writeable = False
+    x1.flags.writeable = False
+
+    return x0, x1
@@ -77,7 +77,7 @@ class BaseFilter(Sound):
             a0, self._z = self.filter(x, self._f, self._z)
 
             self._f = freq
-            self._x = x
+            self._x = x.copy()
             return a0
 
         if self._f is None:
@@ -87,7 +87,7 @@ class BaseFilter(Sound):
             a1 = a1[-len(x):]
 
             self._f = freq
-            self._x = x
+            self._x = x.copy()
             return a1
 
         a0, self._z = self.filter(x, self._f, self._z)
@@ -97,20 +97,41 @@ class BaseFilter(Sound):
         a1 = a1[-len(x):]
 
         self._f = freq
-        self._x = x
+        self._x = x.copy()
+
+        # Crossfade from old to new frequency in place; a1 is a0 + (a1 - a0) * ww.
+        ww = get_crossfade_window(len(x))
+
+        a1 -= a0
+        a1 *= ww
+        a1 += a0
 
-        ww = np.arange(0., 1., 1/len(x))[:,None]
-        a1 = a1 * ww + a0 * (1. - ww)
         return a1
             
     def filter(self, x, freq, z=None):
         return x, None
     
 
+@functools.lru_cache(maxsize=64)
+def get_crossfade_window(size):
+    """Return a read-only linear ramp from 0 to 1 of given size, as a column."""
+
+    ww = np.arange(0., 1., 1/size)[:,None]
+    ww.flags.writeable = False
+
+    return ww
+
+
 def fround(freq):
     return key2freq(round(freq2key(freq), 1))
 
 
+@functools.lru_cache(maxsize=1)
+def get_rounded_frequencies():
+    """Return the sorted distinct frequencies filters are designed for."""
+    return tuple(sorted(set(fround(f) for f in range(1, FPS//2))))
+
+
 class ButterFilter(BaseFilter):
     
     def __init__(self, freq=8192, btype='lowpass', db=24, bandwidth=500, output='ba'):
@@ -126,23 +147,22 @@ class ButterFilter(BaseFilter):
 
     def warmup(self):
 
-        for freq in sorted(set(fround(f) for f in range(1, FPS//2))):
-            signal_butter(self.get_wp(freq), 3, self.db, self.btype, self.output)
-            time.sleep(0)
+        self._table_key = (self.db, self.btype, self.output, self.bandwidth)
+        self._table = get_butter_table(*self._table_key)
 
     def get_wp(self, freq):
+        return get_butter_wp(freq, self.btype, self.bandwidth)
 
-        freq = key2freq(round(freq2key(freq), 1))
-
-        nyq = FPS // 2
+    def get_coefficients(self, wp):
 
-        if self.btype[:3] in ('low', 'hig'):
-            return max(1, min(nyq-1, freq))
+        # Use the table warmed up for the current parameters, if they have
+        # not been changed since, and compute missing entries directly.
+        if self._table_key == (self.db, self.btype, self.output, self.bandwidth):
+            c = self._table.get(wp)
+            if c is not None:
+                return c
 
-        lc = max(1, min(nyq-1, freq - self.bandwidth / 2))
-        hc = max(1, min(nyq-1, freq + self.bandwidth / 2))
-        
-        return (lc, hc)
+        return signal_butter(wp, 3, self.db, self.btype, self.output)
 
     def filter(self, x, freq, z=None, _retry=True):
         
@@ -150,10 +170,10 @@ class ButterFilter(BaseFilter):
             wp = self.get_wp(freq)
 
             if self.output == 'ba':
-                b, a, z0 = signal_butter(wp, 3, self.db, self.btype, self.output)
+                b, a, z0 = self.get_coefficients(wp)
                 return scipy.signal.lfilter(b, a, x, 0, z0 if z is None else z)                
             else:
-                sos, z0 = signal_butter(wp, 3, self.db, self.btype, self.output)
+                sos, z0 = self.get_coefficients(wp)
                 return scipy.signal.sosfilt(sos, x, 0, z0 if z is None else z)
         
         except ValueError:
@@ -163,6 +183,40 @@ class ButterFilter(BaseFilter):
             return self.filter(x, freq, None, _retry=False)
 
 
+def get_butter_wp(freq, btype='lowpass', bandwidth=500):
+
+    freq = key2freq(round(freq2key(freq), 1))
+
+    nyq = FPS // 2
+
+    if btype[:3] in ('low', 'hig'):
+        return max(1, min(nyq-1, freq))
+
+    lc = max(1, min(nyq-1, freq - bandwidth / 2))
+    hc = max(1, min(nyq-1, freq + bandwidth / 2))
+    
+    return (lc, hc)
+
+
+@functools.lru_cache(maxsize=16)
+def get_butter_table(db=24, btype='lowpass', output='ba', bandwidth=500):
+    """Return the coefficients and initial states of a Butterworth filter 
+    for all rounded frequencies, keyed by passband.
+
+    The table is shared by all filters with the same parameters, so only the
+    first of them pays for computing it. Each filter keeps a reference to its
+    table, which therefore cannot be evicted from under it.
+    """
+    table = {}
+
+    for freq in get_rounded_frequencies():
+        wp = get_butter_wp(freq, btype, bandwidth)
+        table[wp] = signal_butter(wp, 3, db, btype, output)
+        time.sleep(0)
+
+    return table
+
+
 @functools.lru_cache(maxsize=4096)
 def signal_butter(wp, gpass=3, gstop=24, btype='lowpass', output='ba', fs=FPS):
 
@@ -203,16 +257,32 @@ class PeakFilter(BaseFilter):
 
     def warmup(self):
 
-        for freq in sorted(set(fround(f) for f in range(1, FPS//2))):
-            signal_iirpeak(freq, self.q)
-            time.sleep(0)
+        self._table_q = self.q
+        self._table = get_iirpeak_table(self.q)
 
     def filter(self, x, freq, z=None):
         
-        b, a, z0 = signal_iirpeak(freq, self.q)
+        c = self._table.get(freq) if self._table_q == self.q else None
+        b, a, z0 = c if c is not None else signal_iirpeak(freq, self.q)
+
         return scipy.signal.lfilter(b, a, x, 0, z0 if z is None else z) 
         
 
+@functools.lru_cache(maxsize=16)
+def get_iirpeak_table(q):
+    """Return the coefficients and initial states of a peak filter for all 
+    rounded frequencies, keyed by frequency, shared like get_butter_table().
+    """
+    table = {}
+
+    for freq in get_rounded_frequencies():
+        table[freq] = signal_iirpeak(freq, q)
+        time.sleep(0)
+
+    return table
+
+
+
 @functools.lru_cache(maxsize=4096)
 def signal_iirpeak(w0, q, fs=FPS):
 
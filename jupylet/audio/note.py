@@ -51,16 +51,23 @@ for o in range(8):
         globals()[no] = k + 11 + 12 * (o if o else 4)
 
 
+#
+# A flat table of all note names, with and without an octave digit, and with
+# either 's' or '#' for sharps, to their keys.
+#
+
+_note_keys = {}
+
+for o in range(10):
+    for n, k in _notes.items():
+        for no in {n, n.replace('s', '#')}:
+            _note_keys[no + str(o)] = k + o * 12 + 11
+            if o == 4:
+                _note_keys[no] = k + o * 12 + 11
+
+
 def note2key(n):
-    
-    if n[-1].isdigit():
-        octave = int(n[-1])
-        n = n[:-1]
-    else:
-        octave = 4
-        
-    n = n.replace('#', 's')
-    return _notes[n] + octave * 12 + 11
+    return _note_keys[n]
 
 
 def key2note(key):
@@ -25,9 +25,12 @@
 """
 
 
+import collections
 import functools
+import threading
+import hashlib
 import logging
-import random
+import time
 import os
 import re
 
@@ -46,29 +49,82 @@ from .sound import key2freq
 logger = logging.getLogger(__name__)
     
 
+#
+# Sample data is decoded as float32, which represents 16 and 24 bit PCM 
+# exactly and halves the memory and bandwidth of sample buffers. Playback
+# phases and indices remain float64, since float32 would lose sub-frame 
+# precision a few minutes into a sample.
+#
+_SFDTYPE = 'float32'
+
 _SFCACHE_THRESHOLD = 10 * FPS
 _SFCACHE_SIZE = 64
 
-_sfcache = {}
+# The largest jump between consecutive indices read by SoundFileArray in
+# one read; a larger jump starts a new read.
+_SFARRAY_GAP = 4096
+
+_sfcache = collections.OrderedDict()
+_sfcache_lock = threading.Lock()
+
+#
+# Long sound files are decoded into this directory; set the JUPYLET_SOUND_CACHE
+# environment variable to relocate it, or to an empty string to disable it.
+# The least recently used files are deleted to keep its total size below
+# _SFCACHE_DIR_LIMIT bytes.
+#
+_SFCACHE_DIR = os.environ.get('JUPYLET_SOUND_CACHE', os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'jupylet',
+    'sounds',
+))
+
+_SFCACHE_DIR_LIMIT = 2 ** 30
 
 
 def soundfile_read(path, zero_pad=False):
-    """Read sound file as a numpy array."""
+    """Read sound file as a numpy array.
+    
+    Files longer than _SFCACHE_THRESHOLD frames are not decoded into memory.
+    Instead, they are decoded once into a .npy file in _SFCACHE_DIR which is
+    then returned as a read-only memory mapped array. If that fails, a 
+    read-only array-like SoundFileArray object is returned that reads frames
+    from the file on demand.
+    """
     logger.info('Enter soundfile_read(path=%r).', path)
 
-    data, fps = _sfcache.get(path, (None, None))
-    
+    with _sfcache_lock:
+
+        data, fps = _sfcache.get(path, (None, None))
+        
+        if data is not None:
+            _sfcache.move_to_end(path)
+
     if data is None:
     
-        data, fps = sf.read(path, dtype='float64') 
+        info = sf.info(path)
+
+        if info.frames > _SFCACHE_THRESHOLD:
+
+            data = soundfile_mmap(path, info) if _SFCACHE_DIR else None
+
+            if data is None:
+                return SoundFileArray(path, zero_pad), info.samplerate
+
+            return (data if zero_pad else data[:-1]), info.samplerate
+
+        data, fps = sf.read(path, dtype=_SFDTYPE)
         data = np.pad(data, ((0, 1), (0, 0))[:len(data.shape)])
         
         if len(data) <= _SFCACHE_THRESHOLD:
 
-            if len(_sfcache) >= _SFCACHE_SIZE:
-                _sfcache.pop(random.choice(list(_sfcache.keys())))
+            # Evict the least recently used sound file.
+            with _sfcache_lock:
+
+                if path not in _sfcache and len(_sfcache) >= _SFCACHE_SIZE:
+                    _sfcache.popitem(last=False)
 
-            _sfcache[path] = (data, fps)
+                _sfcache[path] = (data, fps)
 
     if not zero_pad:
         data = data[:-1]
@@ -76,25 +132,223 @@ def soundfile_read(path, zero_pad=False):
     return data, fps
 
 
-#
-# Do not change this "constant"!
-#
-_NP_ZERO = np.zeros((1,), dtype='float64')
+def soundfile_mmap(path, info):
+    """Memory map sound file decoded into a zero padded .npy cache file.
+
+    Returns:
+        numpy.memmap: A read-only memory mapped array, or None on failure.
+    """
+    st = os.stat(path)
+    
+    key = '%s:%s:%s:%s' % (os.path.abspath(path), st.st_mtime_ns, st.st_size, _SFDTYPE)
+    npy = os.path.join(_SFCACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.npy')
 
+    tmp = '%s.%s.tmp' % (npy, os.getpid())
 
-def get_indices(intervals=1, start=0, frames=8192):
+    try:
+        if os.path.exists(npy):
+            os.utime(npy)
+
+        else:
+            logger.info('Decode %r into cache file %r.', path, npy)
+
+            os.makedirs(_SFCACHE_DIR, exist_ok=True)
+
+            shape = (info.frames + 1,) + ((info.channels,) if info.channels > 1 else ())
+
+            # Decode block by block, to avoid holding the entire file in memory.
+            a0 = np.lib.format.open_memmap(tmp, mode='w+', dtype=_SFDTYPE, shape=shape)
+            i0 = 0
+
+            for b0 in sf.blocks(path, blocksize=FPS, dtype=_SFDTYPE):
+                b0 = b0[:info.frames - i0]
+                a0[i0:i0 + len(b0)] = b0
+                i0 += len(b0)
+
+            a0.flush()
+            del a0
+
+            os.replace(tmp, npy)
+
+            soundfile_cache_cleanup(keep=npy)
+
+        return np.load(npy, mmap_mode='r')
+
+    # soundfile raises LibsndfileError, a RuntimeError, on decoding errors.
+    except (OSError, ValueError, RuntimeError):
+        logger.exception('Failed to cache sound file %r.', path)
+
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def soundfile_cache_cleanup(keep=None, limit=None):
+    """Delete least recently used sound cache files above the size limit."""
+
+    limit = _SFCACHE_DIR_LIMIT if limit is None else limit
+
+    fl = []
+
+    for e in os.scandir(_SFCACHE_DIR):
+
+        st = e.stat()
         
-    if isinstance(intervals, np.ndarray):
-        pt = intervals.reshape(-1)
-    else:
-        pt = intervals * np.ones((frames,), dtype='float64')
+        # Skip temporary files that may still be written by another process.
+        if e.name.endswith('.tmp') and time.time() - st.st_mtime < 3600:
+            continue
+
+        fl.append((st.st_mtime, st.st_size, e.path))
+
+    total = sum(f[1] for f in fl)
+
+    for mtime, size, path in sorted(fl):
+
+        if total <= limit:
+            break
+
+        if path == keep:
+            continue
+
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+class SoundFileArray(object):
+    """A read-only array-like view of a sound file.
+    
+    Frames are read from the file on demand, as they are indexed, instead of
+    decoding the entire file into memory. This object supports len(), slices
+    and integer array indexing of frames, as used by the Sample class, and
+    always has a (frames, channels) shape.
+
+    Args:
+        path (str): Path to sound file.
+        zero_pad (bool): Append a frame of zeros at the end of the file.
+    """
+    def __init__(self, path, zero_pad=False):
+
+        self.path = path
+        self.sf = sf.SoundFile(path)
+
+        self.dtype = np.dtype(_SFDTYPE)
+        self.shape = (self.sf.frames + int(zero_pad), self.sf.channels)
+
+    def close(self):
+        """Close the underlying sound file."""
+        self.sf.close()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+
+        if isinstance(key, slice):
+
+            start, stop, step = key.indices(len(self))
             
-    p0 = start + _NP_ZERO
-    p1 = np.concatenate((p0, pt))
-    p2 = np.cumsum(p1)
+            if step < 0:
+                return self[np.arange(start, stop, step)]
+
+            return self.read(start, stop)[::step]
+
+        indices = np.asarray(key)
+        
+        if not indices.size:
+            return np.zeros(indices.shape + self.shape[1:], dtype=self.dtype)
+
+        indices = np.where(indices < 0, indices + len(self), indices)
+
+        if indices.min() < 0 or indices.max() >= len(self):
+            raise IndexError('Index out of bounds for sound file of length %s.' % len(self))
+
+        #
+        # Read each run of nearby indices separately. In particular, when
+        # playback wraps around a loop, this reads the frames before and
+        # after the wrap point rather than the entire loop in between.
+        #
+
+        flat = indices.reshape(-1)
+        
+        breaks = np.flatnonzero(np.abs(np.diff(flat)) > _SFARRAY_GAP) + 1
+        breaks = [0] + breaks.tolist() + [len(flat)]
+
+        a0 = np.empty((len(flat),) + self.shape[1:], dtype=self.dtype)
+
+        for r0, r1 in zip(breaks[:-1], breaks[1:]):
+
+            run = flat[r0:r1]
+
+            i0 = int(run.min())
+            i1 = int(run.max()) + 1
+
+            a0[r0:r1] = self.read(i0, i1)[run - i0]
+
+        return a0.reshape(indices.shape + self.shape[1:])
+
+    def read(self, start, stop):
+        """Read frames from given start frame up to given stop frame."""
+
+        stop = max(start, stop)
+        
+        s0 = min(start, self.sf.frames)
+        s1 = min(stop, self.sf.frames)
+
+        # Avoid a seek when reading sequentially, which is the common case. 
+        if self.sf.tell() != s0:
+            self.sf.seek(s0)
+
+        a0 = self.sf.read(s1 - s0, dtype=_SFDTYPE, always_2d=True)
+        
+        if len(a0) < stop - start:
+            a0 = np.pad(a0, ((0, stop - start - len(a0)), (0, 0)))
+
+        return a0
+
+
+@functools.lru_cache(maxsize=16)
+def get_frame_offsets(frames):
+    """Return a read-only array of the frame offsets 0, 1, ..., frames - 1."""
+
+    a0 = np.arange(frames, dtype='float64')
+    a0.flags.writeable = False
+
+    return a0
+
+
+def get_indices(intervals=1, start=0, frames=8192):
+        
+    #
+    # With a constant interval the indices are an arithmetic progression
+    # and there is nothing to accumulate.
+    #
+
+    if not isinstance(intervals, np.ndarray):
+
+        indices = np.multiply(get_frame_offsets(frames), intervals)
+        indices += start
+
+        return indices, start + frames * intervals
+
+    pt = intervals.reshape(-1)
+    frames = len(pt)
+
+    #
+    # Accumulate start and intervals in a single buffer of frames + 1.
+    #
+
+    p0 = np.empty((frames + 1,), dtype='float64')
+    p0[0] = start
+    p0[1:] = pt
+
+    np.cumsum(p0, out=p0)
     
-    indices = p2[:-1]
-    next_start = p2[-1] 
+    indices = p0[:-1]
+    next_start = p0[-1] 
     
     return indices, next_start
 
@@ -104,13 +358,41 @@ def compute_loop(indices, buff_end, loop=False, loop_start=0, loop_end=0):
     indices = indices.astype('int64')
     
     if not loop or loop_end <= 0:
-        return indices.clip(0, buff_end-1)
+        return np.clip(indices, 0, buff_end-1, out=indices)
     
-    il = indices < loop_start
-    i0 = indices * il
-    i1 = ((indices - loop_start) % (loop_end - loop_start) + loop_start) * (1 - il)
+    #
+    # Wrap indices past the loop start around the loop segment, and select
+    # the original indices before it, without multiplying by masks.
+    #
+
+    span = loop_end - loop_start
+
+    i1 = indices - loop_start
+    np.remainder(i1, span, out=i1)
+    i1 += loop_start
+
+    np.copyto(i1, indices, where=indices < loop_start)
+
+    return i1
+
+
+def load_buffer(path):
+    """Load sound file as a zero padded (frames, channels) sample buffer.
     
-    return i0 + i1
+    The buffer is kept frame-major and C-contiguous. Playback gathers whole
+    frames at computed indices, and with frame-major layout the channels of
+    each gathered frame are adjacent in memory, so a stereo frame is read in
+    a single cache line rather than from two separate channel arrays.
+    """
+    buff = soundfile_read(path, zero_pad=True)[0]
+
+    if len(buff.shape) == 1:
+        buff = buff[:,None]
+
+    if isinstance(buff, np.ndarray) and not buff.flags.c_contiguous:
+        buff = np.ascontiguousarray(buff)
+
+    return buff
 
 
 @functools.lru_cache(maxsize=1024)
@@ -196,6 +478,13 @@ class Sample(GatedSound):
             loop_end = 0,
             pitch_keycenter = None,
         )
+
+        # Load the sample now rather than on the first call to forward(),
+        # which runs on the audio thread; decoding a long file into the 
+        # sound cache may take a while. SFZ regions depend on the played 
+        # key and are still loaded as notes are played.
+        if not self.path.endswith('.sfz'):
+            self.load()
         
     def reset(self, shared=False):
         
@@ -203,6 +492,21 @@ class Sample(GatedSound):
         
         self.phase = 0
         
+    @property
+    def done(self):
+
+        # A sample that does not loop is silent once it has been played past
+        # the end of its buffer; mark it done without scanning its output.
+        if not self._done and not self.loop and self.buff is not None:
+            if self.phase >= len(self.buff):
+                self._done = self.index or 1
+                if self._a0 is not None:
+                    self._a0 = self._a0 * 0
+                if self._ac is not None:
+                    self._ac = self._ac * 0
+
+        return super().done
+
     def forward(self, key_modulation=None):
         
         self.load()
@@ -214,7 +518,32 @@ class Sample(GatedSound):
         pitch_keycenter = self.region['pitch_keycenter']
         
         if pitch_keycenter is None and key_modulation is None:
-            
+
+            #
+            # Fast path - when the block falls entirely before the loop end
+            # (or buffer end) it is simply a contiguous slice of the buffer.
+            # The slice is copied into the work array of this sound, since
+            # the buffer is shared and parent sounds may modify the output 
+            # in place.
+            #
+
+            p0 = self.phase
+            pe = le if self.loop and le > 0 else lb
+
+            if p0 % 1 == 0 and 0 <= p0 and p0 + self.frames <= pe:
+
+                p0 = int(p0)
+                self.phase = p0 + self.frames
+
+                a0 = self.buff[p0:self.phase]
+
+                if isinstance(self.buff, np.ndarray):
+                    a1 = self._get_out(a0.shape, a0.dtype)
+                    np.copyto(a1, a0)
+                    return a1
+
+                return a0
+
             indices, self.phase = get_indices(1., self.phase, self.frames)
             indices = compute_loop(indices, lb, self.loop, ls, le)
             
@@ -237,19 +566,29 @@ class Sample(GatedSound):
         indices1 = compute_loop(indices + 1, lb, self.loop, ls, le)
         
         a0 = self.buff        
-        a1 = a0[indices0]
-        a2 = a0[indices1]
+        if isinstance(a0, np.ndarray):
+            a1 = np.take(a0, indices0, axis=0)
+            a2 = np.take(a0, indices1, axis=0, out=self._get_out(a1.shape, a1.dtype))
+        else:
+            a1 = a0[indices0]
+            a2 = a0[indices1]
         
-        a3 = a2 * t3 + a1 * (1 - t3)
+        # Interpolate in place, since a2 is a work array of this sound;
+        # a2 becomes a1 + (a2 - a1) * t3.
+        a2 -= a1
+        a2 *= t3
+        a2 += a1
         
         lp = self.get_loop_power(indices)
         if lp is not None:
-            a3 = a3 * lp[:, None]
+            a2 *= lp[:, None]
         
         g0 = self.gate()
         e0 = self.env0(g0)
 
-        return a3 * e0
+        a2 *= e0
+
+        return a2
 
     def get_loop_power(self, indices):
         
@@ -275,10 +614,7 @@ class Sample(GatedSound):
         if self.buff is not None:
             return self
         
-        self.buff = soundfile_read(self.path, zero_pad=True)[0]
-
-        if len(self.buff.shape) == 1:
-            self.buff = self.buff[:,None]
+        self.buff = load_buffer(self.path)
 
         if self.region['loop_end'] == 0:
             self.region['loop_end'] = len(self.buff) - 1
@@ -294,10 +630,7 @@ class Sample(GatedSound):
         
         path = os.path.join(os.path.dirname(self.path), region['sample'])
         
-        self.buff = soundfile_read(path, zero_pad=True)[0] 
-        
-        if len(self.buff.shape) == 1:
-            self.buff = self.buff[:,None]
+        self.buff = load_buffer(path)
 
         self.region = region
 
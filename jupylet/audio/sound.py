@@ -41,6 +41,7 @@ import scipy.signal
 import numpy as np
 
 from ..utils import settable, Dict, trimmed_traceback
+from ..env import is_sphinx_build
 
 from ..audio import FPS, MIDDLE_C, DEFAULT_AMP, t2frames, frames2t   
 from ..audio import get_time, get_bpm, get_note_value
@@ -144,7 +145,13 @@ def _expand_channels(a0, channels):
     if len(a0.shape) == 1:
         a0 = np.expand_dims(a0, -1)
 
-    if a0.shape[1] < channels:
+    # Broadcast a mono signal to all channels as a read-only view rather 
+    # than a copy; the copy is then made once, by the multiplication that
+    # amplifies and pans the signal.
+    if a0.shape[1] == 1 and channels > 1:
+        a0 = np.broadcast_to(a0, (len(a0), channels))
+
+    elif a0.shape[1] < channels:
         a0 = a0.repeat(channels, 1)
 
     if a0.shape[1] > channels:
@@ -155,12 +162,27 @@ def _expand_channels(a0, channels):
 
 #
 # A helper function to amplify and pan (balance) audio between the left and
-# right channels.
+# right channels. It is called for every playing sound on every audio buffer,
+# so the resulting (read-only) arrays are cached. Amplitude and pan are 
+# quantized to keep the cache small when they are modulated continuously;
+# amplitude relative to its magnitude, so that quiet sounds keep their level,
+# and pan, which lies in [-1, 1], in absolute steps.
 #
 
-#@functools.lru_cache(maxsize=1024)
 def _ampan(amp, pan):
-    return np.array([1 - pan, 1 + pan]) * (amp / 2)
+
+    m, e = math.frexp(amp)
+
+    return _ampan0(math.ldexp(round(m * 1024) / 1024, e), round(pan * 1024) / 1024)
+
+
+@functools.lru_cache(maxsize=4096)
+def _ampan0(amp, pan):
+
+    a0 = (np.array([1 - pan, 1 + pan]) * (amp / 2)).astype('float32')
+    a0.flags.writeable = False
+
+    return a0
 
 
 _LOG_C4 = math.log(MIDDLE_C)
@@ -225,6 +247,9 @@ class Sound(object):
         
         self._buffer = None
 
+        # A work array that forward() may reuse for its output, see _get_out().
+        self._out = None
+
         # Indicate if sound is shared by multiple sounds. For example
         # an effect may be shared by multiple sounds. This affects how it 
         # should react to reset() calls.
@@ -361,6 +386,7 @@ class Sound(object):
             self._polys.append(weakref.ref(o))
           
         o._polys = []
+        o._out = None
 
         return o
        
@@ -380,6 +406,7 @@ class Sound(object):
         self._a0 = None
         self._ac = None
         self._al = []
+        self._out = None
 
         self._error = None
 
@@ -411,7 +438,7 @@ class Sound(object):
             return False
         
         if not self._done:
-            if np.abs(self._a0).max() < 1e-4:
+            if max(self._a0.max(), -self._a0.min()) < 1e-4:
                 self._done = self.index or 1
                 self._a0 = self._a0 * 0
                 self._ac = self._ac * 0
@@ -448,10 +475,13 @@ class Sound(object):
 
             a0 = _expand_channels(a0, channels)
             
+            amp = self.velocity / 128 * self.amp
+
+            # The output sent to the device is float32, so is this buffer.
             if channels == 2:
-                self._ac = a0 * _ampan(self.velocity / 128 * self.amp, self.pan)
+                self._ac = np.multiply(a0, _ampan(amp, self.pan), dtype='float32')
             else:
-                self._ac = a0 * (self.velocity / 128 * self.amp)
+                self._ac = np.multiply(a0, amp, dtype='float32')
 
         return self._ac
 
@@ -478,7 +508,7 @@ class Sound(object):
             self.index += len(self._a0)
         
         if DEBUG:
-            self._al = self._al[-255:] + [self._a0]
+            self._al = self._al[-255:] + [np.array(self._a0)]
 
         return self._a0
 
@@ -498,6 +528,25 @@ class Sound(object):
     def forward(self, *args, **kwargs):
         return np.zeros((self.frames,))
     
+    def _get_out(self, shape, dtype='float64'):
+        """Get a work array of given shape and dtype for the output of forward().
+
+        The array is allocated once and then reused by subsequent calls, so
+        what forward() writes into it is only valid until its next call. 
+        A sound that holds on to the output of another sound beyond that, for
+        example as filter history, must copy it. Shared sounds, whose forward()
+        may be called by several parent sounds for the same block, always get 
+        a new array.
+        """
+        out = self._out
+
+        if out is None or out.shape != shape or out.dtype != dtype or self._shared:
+            out = np.empty(shape, dtype=dtype)
+            if not self._shared:
+                self._out = out
+
+        return out
+    
     @property
     def key(self):
         """float: Get current sound frequency in semitone units where 60 is middle C."""
@@ -810,10 +859,14 @@ def get_exponential_adsr_curve(dt, start=0, end=None, th=0.01):
     start = start + 1
         
     a0 = np.arange(start/df, end/df + EPSILON, 1/df, dtype='float64')
-    a1 = np.exp(a0 * math.log(th))
-    a2 = (1. - a1) / (1. - th)
+
+    # Compute (1 - exp(a0 * log(th))) / (1 - th) in place.
+    a0 *= math.log(th)
+    np.exp(a0, out=a0)
+    np.subtract(1., a0, out=a0)
+    a0 /= 1. - th
     
-    return a2
+    return a0
 
 
 def get_linear_adsr_curve(dt, start=0, end=None):
@@ -879,6 +932,9 @@ class Envelope(Sound):
         # Last gate value.
         self._lgate = 0
 
+        # Last flat (sustain or idle) curve, reused while it does not change.
+        self._flat = None
+
     def reset(self, shared=False):
         
         super().reset(shared)
@@ -888,6 +944,7 @@ class Envelope(Sound):
         self._valu0 = 0
         self._valu1 = 0
         self._lgate = 0        
+        self._flat = None
         
     def forward(self, gate):
         
@@ -924,6 +981,10 @@ class Envelope(Sound):
                 self._start = index
                 self._valu0 = self._valu1
             
+        # Most buffers fall within a single envelope state.
+        if len(curves) == 1:
+            return curves[0][:,None]
+
         return np.concatenate(curves)[:,None]
     
     def get_curve(self, start, end):
@@ -931,7 +992,7 @@ class Envelope(Sound):
         end = max(start, end)
 
         if self._state in (None, 'sustain'):
-            return np.ones((end - start,), dtype='float64') * self._valu0
+            return self.get_flat_curve(end - start)
         
         start = start - self._start
         end = end - self._start
@@ -963,7 +1024,8 @@ class Envelope(Sound):
             target = 0.
             next_state = None
 
-        curve = (target - self._valu0) * curve  + self._valu0
+        curve *= target - self._valu0
+        curve += self._valu0
         
         if done:
             self._state = next_state
@@ -974,11 +1036,18 @@ class Envelope(Sound):
         
         return curve
 
+    def get_flat_curve(self, size):
 
-#
-# Do not change this "constant"!
-#
-_NP_ZERO = np.zeros((1,), dtype='float64')
+        # A held note spends most of its buffers in the sustain plateau, so
+        # the same read-only flat curve is returned as long as it fits.
+        fc = self._flat
+
+        if fc is None or len(fc) != size or size and fc[0] != self._valu0:
+            fc = np.full((size,), self._valu0, dtype='float64')
+            fc.flags.writeable = False
+            self._flat = fc
+
+        return fc
 
 
 def get_radians(freq, start=0, frames=8192):
@@ -987,38 +1056,52 @@ def get_radians(freq, start=0, frames=8192):
     
     if isinstance(pt, np.ndarray):
         pt = pt.reshape(-1)
-    else:
-        pt = pt * np.ones((frames,), dtype='float64')
-            
-    p0 = start + _NP_ZERO
-    p1 = np.concatenate((p0, pt))
-    p2 = np.cumsum(p1)
+        frames = len(pt)
+
+    #
+    # Accumulate start and intervals in a single buffer of frames + 1.
+    #
+
+    p0 = np.empty((frames + 1,), dtype='float64')
+    p0[0] = start
+    p0[1:] = pt
+
+    np.cumsum(p0, out=p0)
     
-    radians = p2[:-1]
-    next_start = p2[-1] 
+    radians = p0[:-1]
+    next_start = p0[-1] 
     
     return radians, next_start
 
 
-def get_sine_wave(freq, phase=0, frames=8192, **kwargs):
+def get_sine_wave(freq, phase=0, frames=8192, out=None, **kwargs):
     
     radians, phase_o = get_radians(freq, phase, frames)
     
-    a0 = np.sin(radians)
+    a0 = np.sin(radians, out=out)
     
     return a0, phase_o
 
 
-def get_triangle_wave(freq, phase=0, frames=8192, **kwargs):
+def get_triangle_wave(freq, phase=0, frames=8192, out=None, **kwargs):
     
     radians, phase_o = get_radians(freq, phase, frames)
 
-    a0 = radians % (2 * math.pi)
-    a1 = a0 / math.pi - 1
-    a2 = a1 * np.sign(-a1)
-    a3 = a2 * 2 + 1
+    #
+    # Compute 1 - 2 * |radians % 2pi / pi - 1| in place to avoid 
+    # allocating a temporary array at each step.
+    #
 
-    return a3, phase_o
+    a0 = radians
+
+    np.remainder(a0, 2 * math.pi, out=a0)
+    a0 /= math.pi
+    a0 -= 1
+    np.abs(a0, out=a0)
+    a0 *= -2
+    a0 = np.add(a0, 1, out=a0 if out is None else out)
+
+    return a0, phase_o
 
 
 @functools.lru_cache(maxsize=256)
@@ -1032,12 +1115,9 @@ def get_sawtooth_cycle(nharmonics, size=1024):
         return harmonic
 
     return harmonic + get_sawtooth_cycle(nharmonics - 1, size)
-    
-# Warmup
-len(get_sawtooth_cycle(128))
 
 
-def get_sawtooth_wave(freq, phase=0, frames=8192, sign=1., **kwargs):
+def get_sawtooth_wave(freq, phase=0, frames=8192, sign=1., out=None, **kwargs):
     
     radians, phase_o = get_radians(freq, phase, frames)
 
@@ -1053,11 +1133,15 @@ def get_sawtooth_wave(freq, phase=0, frames=8192, sign=1., **kwargs):
 
     sawtooth = get_sawtooth_cycle(nharmonics, size)
 
-    indices = (size / 2 / math.pi * radians).astype('int32') % size
-    samples = sawtooth[indices]
+    radians *= size / 2 / math.pi
+
+    indices = radians.astype('int32')
+    indices %= size
+
+    samples = np.take(sawtooth, indices, out=out)
     
     if sign != 1.:
-        samples = samples * sign
+        samples *= sign
 
     return samples, phase_o
 
@@ -1082,11 +1166,8 @@ def get_square_cycle(nharmonics, size=1024):
 
     return harmonic + get_square_cycle(nharmonics - 1, size)
 
-# Warmup
-len(get_square_cycle(128))
 
-
-def get_square_wave(freq, phase=0, frames=8192, duty=0.5, **kwargs):
+def get_square_wave(freq, phase=0, frames=8192, duty=0.5, out=None, **kwargs):
     
     if isinstance(duty, np.ndarray):
         duty = duty.reshape(-1).clip(0.01, 0.99)
@@ -1105,7 +1186,10 @@ def get_square_wave(freq, phase=0, frames=8192, duty=0.5, **kwargs):
 
     square0 = get_square_cycle(nharmonics, size)
 
-    indices = (size / 2 / math.pi * radians).astype('int32') % size
+    radians *= size / 2 / math.pi
+
+    indices = radians.astype('int32')
+    indices %= size
 
     #
     # When duty is a modulating array, the following simple scheme
@@ -1115,14 +1199,26 @@ def get_square_wave(freq, phase=0, frames=8192, duty=0.5, **kwargs):
     #
     if type(duty) in (int, float):
         duty = int(duty * _nduties)
+        samples = np.take(square0[duty], indices, out=out)
     else:
-        duty = (duty * _nduties).astype('int32')
-
-    samples = square0[duty, indices]
+        duty *= _nduties
+        duty = duty.astype('int32')
+        samples = square0[duty, indices]
 
     return samples, phase_o
 
 
+_wave_functions = dict(
+    sine = get_sine_wave,
+    triangle = get_triangle_wave,
+    sawtooth = get_sawtooth_wave,
+    square = get_square_wave,
+    pulse = get_square_wave,
+    saw = get_sawtooth_wave,
+    tri = get_triangle_wave,
+)
+
+
 class Oscillator(Sound):
 
     """Waveform generator for `sine`, `triangle`, anti-aliased `sawtooth`, and 
@@ -1155,6 +1251,13 @@ class Oscillator(Sound):
         self.sign = sign
         self.duty = duty
         self.kwargs = kwargs
+
+        self._shape = None
+        self._get_wave = None
+
+        # The work array last returned by _get_out() and its 1d view.
+        self._out2 = None
+        self._out1 = None
         
     def forward(self, key_modulation=None, sign=None, duty=None, **kwargs):
         
@@ -1169,29 +1272,55 @@ class Oscillator(Sound):
         if duty is None:
             duty = self.duty
             
-        if self.kwargs:
-            kwargs = dict(kwargs)
-            kwargs.update(self.kwargs)
-        
-        get_wave = dict(
-            sine = get_sine_wave,
-            triangle = get_triangle_wave,
-            sawtooth = get_sawtooth_wave,
-            square = get_square_wave,
-            pulse = get_square_wave,
-            saw = get_sawtooth_wave,
-            tri = get_triangle_wave,
-        ).get(self.shape, self.shape)
-        
-        a0, self.phase = get_wave(
+        # Merge keyword arguments only when both are given.
+        if kwargs and self.kwargs:
+            kwargs = dict(kwargs, **self.kwargs)
+        else:
+            kwargs = kwargs or self.kwargs
+        
+        # Resolve the wave function only when the shape changes.
+        if self._shape != self.shape:
+            self._shape = self.shape
+            self._get_wave = _wave_functions.get(self.shape, self.shape)
+
+        #
+        # Built-in wave functions write into the (frames, 1) work array of 
+        # the oscillator, which is then returned as is; see Sound._get_out().
+        # Custom wave functions are not expected to accept an out argument.
+        #
+
+        if self._get_wave is self.shape:
+
+            a0, self.phase = self._get_wave(
+                freq, 
+                self.phase, 
+                self.frames, 
+                sign=sign,
+                duty=duty, 
+                **kwargs
+            )
+
+            return a0[:,None]
+
+        out = self._get_out((self.frames, 1))
+
+        if out is not self._out2:
+            self._out2 = out
+            self._out1 = out[:,0]
+
+        a0, self.phase = self._get_wave(
             freq, 
             self.phase, 
             self.frames, 
-            sign=self.sign,
+            sign=sign,
             duty=duty, 
+            out=self._out1,
             **kwargs
         )
         
+        if a0 is self._out1:
+            return out
+
         return a0[:,None]
 
 
@@ -1334,25 +1463,85 @@ class PhaseModulator(Sound):
         super().__init__(shared=shared)
         
         self.beta = beta
+
+        # A work array holding the buffered frames followed by the carrier.
+        self._work = None
                 
     def forward(self, carrier, signal):
         
-        signal = signal.mean(-1).clip(-1, 1)
+        signal = signal.mean(-1)
         beta = int(self.beta) + 1
+
+        nb = 2 * beta
+        nc = carrier.shape[1]
         
         if self._buffer is None:
-            self._buffer = np.zeros((2 * beta, carrier.shape[1]), dtype=carrier.dtype)
-            
-        t1 = np.arange(beta, beta + len(carrier), dtype='float64') + self.beta * signal
+            self._buffer = np.zeros((nb, nc), dtype=carrier.dtype)
+        
+        #
+        # Compute the modulated read positions, their integer parts and their
+        # fractions in place, reusing the array returned by mean(). A 1-D
+        # signal averages to a numpy scalar, which cannot be written into.
+        #
+
+        if isinstance(signal, np.ndarray):
+            t1 = np.clip(signal, -1, 1, out=signal)
+        else:
+            t1 = np.clip(signal, -1, 1)
+
+        t1 *= self.beta
+        t1 *= self.beta
+        t1 += np.arange(beta, beta + len(carrier), dtype='float64')
+
         t2 = t1.astype('int64')
-        t3 = (t1 - t2.astype('float64'))[:, None]
+        t3 = np.subtract(t1, t2, out=t1)[:, None]
         
-        a0 = np.concatenate((self._buffer, carrier))
+        #
+        # Copy the buffered frames and the carrier into a persistent work 
+        # array instead of concatenating them into a new array at each call.
+        #
+
+        a0 = self._work
+        
+        if a0 is None or a0.shape != (nb + len(carrier), nc) or a0.dtype != carrier.dtype:
+            a0 = self._work = np.empty((nb + len(carrier), nc), dtype=carrier.dtype)
+
+        b0 = self._buffer[-nb:]
+
+        a0[:nb - len(b0)] = 0
+        a0[nb - len(b0):nb] = b0
+        a0[nb:] = carrier
+
         a1 = a0[t2]
-        a2 = a0[t2 + 1]
-        a3 = a2 * t3 + a1 * (1 - t3)
+
+        t2 += 1
+        a2 = np.take(a0, t2, axis=0, out=self._get_out(a1.shape, a1.dtype))
+
+        # Linear interpolation in place; a2 becomes a1 + (a2 - a1) * t3.
+        a2 -= a1
+        a2 *= t3
+        a2 += a1
         
-        self._buffer = a0[-2 * beta:]
+        if self._buffer.shape == (nb, nc):
+            np.copyto(self._buffer, a0[-nb:])
+        else:
+            self._buffer = a0[-nb:].copy()
         
-        return a3
+        return a2
+
+
+def _warmup():
+    """Precompute the wave cycle tables at import time.
+    
+    The tables are computed recursively for all harmonics up to 128 and would
+    otherwise stall the audio thread on the first note of each waveform.
+    """
+    if is_sphinx_build():
+        return
+
+    get_sawtooth_cycle(128)
+    get_square_cycle(128)
+
+
+_warmup()
 
@@ -37,7 +37,7 @@ import moderngl_window as mglw
 import numpy as np
 
 from .collision import trbl, hitmap_and_outline_from_alpha, compute_collisions
-from .resource import load_texture, pil_from_texture, get_shader_2d
+from .resource import load_texture, load_image, pil_from_texture, get_shader_2d
 from .utils import glm_dumps, glm_loads
 from .color import c2v
 from .state import State
@@ -48,6 +48,15 @@ from .lru import SPRITE_TEXTURE_UNIT
 _empty_array = np.array([])
 
 
+# Image modes that are uploaded to textures as is.
+_TEXTURE_MODES = {'L', 'LA', 'RGB', 'RGBA'}
+
+
+def _image_key(im):
+    """Return a key identifying the data hitmap_and_outline_from_alpha() uses."""
+    return im.size, hash(im.getchannel(len(im.getbands()) - 1).tobytes())
+
+
 class Sprite(Node):
 
     """A 2D game sprite.
@@ -107,10 +116,13 @@ class Sprite(Node):
             pos=(0.5, 0.5)
         )
 
+        im = load_image(img, autocrop)
+
+        # The texture loader closes the image it is given, so give it a copy
+        # if the image is still needed for the hitmap.
         self.texture = load_texture(
-            img,
+            im.copy() if collisions else im,
             anisotropy=anisotropy, 
-            autocrop=autocrop,
             mipmap=mipmap, 
             flip=False, 
         )
@@ -124,8 +136,13 @@ class Sprite(Node):
 
         self._collisions = collisions
 
+        self._trbl_key = None
+        self._trbl_value = None
+
+        self._hitmap_key = None
+
         if self._collisions:
-            self.hitmap, self.outline = hitmap_and_outline_from_alpha(self.image)
+            self._set_hitmap(im)
         
         self.scale = scale
 
@@ -279,23 +296,58 @@ class Sprite(Node):
     @image.setter
     def image(self, img):
         
-        scale = self.scale
-
-        self.texture.release()
-        self.texture = load_texture(
-            img,
-            anisotropy=self.anisotropy, 
-            autocrop=self.autocrop,
-            mipmap=self.mipmap, 
-            flip=False, 
-        )
-        self.texture.repeat_x = False
-        self.texture.repeat_y = False
+        im = load_image(img, self.autocrop)
+        tx = self.texture
 
-        self.scale = scale
+        #
+        # If the new image has the same size and components as the current
+        # texture, as is typical for animation frames, upload it into the 
+        # existing texture instead of creating a new one.
+        #
+
+        if im.mode in _TEXTURE_MODES and (im.width, im.height, len(im.getbands())) == (
+            tx.width, tx.height, tx.components
+        ):
+            tx.write(im.tobytes())
+
+            if self.mipmap:
+                tx.build_mipmaps()
+
+        else:
+            scale = self.scale
+
+            tx.release()
+            # The texture loader closes the image it is given, so give it a
+            # copy if the image is still needed for the hitmap.
+            self.texture = load_texture(
+                im.copy() if self._collisions else im,
+                anisotropy=self.anisotropy, 
+                mipmap=self.mipmap, 
+                flip=False, 
+            )
+            self.texture.repeat_x = False
+            self.texture.repeat_y = False
+
+            self.scale = scale
 
         if self._collisions:
-            self.hitmap, self.outline = hitmap_and_outline_from_alpha(self.image)
+            self._set_hitmap(im)
+
+    def _set_hitmap(self, im):
+        """Compute collision hitmap and outline from given decoded image.
+
+        The hitmap is computed from the image the texture was created from
+        rather than read back from the GPU texture, and only if the size or
+        alpha channel of the image changed since it was last computed.
+        """
+        if im.mode not in _TEXTURE_MODES:
+            im = self.image
+
+        key = _image_key(im)
+
+        if key != self._hitmap_key:
+            self._hitmap_key = key
+            self.hitmap, self.outline = hitmap_and_outline_from_alpha(im)
 
     def collisions_with(self, o, debug=False):
         """Compute collisions with given sprite.
@@ -352,20 +404,13 @@ class Sprite(Node):
         Returns:
             float: Angle in degrees.
         """
-
-        qd = {
-            (True, True): 0,
-            (True, False): 180,
-            (False, False): 180,
-            (False, True): 360,
-        }
-        
         x, y = pos or (o.position.x, o.position.y)
         
         dx = x - self.position.x
         dy = y - self.position.y
 
-        a0 = math.atan(dy / (dx or 1e-7)) / math.pi * 180 + qd[(dy >= 0, dx >= 0)]
+        # Counterclockwise angle in the range [0, 360).
+        a0 = math.degrees(math.atan2(dy, dx)) % 360
 
         return -a0
 
@@ -401,15 +446,26 @@ class Sprite(Node):
         return rs ** .5
         
     def _trbl(self):
+
         tx = self.texture
-        return trbl(
-            tx.width, 
-            tx.height, 
-            self.anchor.x * tx.width, 
-            self.anchor.y * tx.height, 
-            self.angle,
-            self.scale
-        )
+        rq = self.rotation
+
+        # Key the bounding box on the raw rotation and scale, which is cheaper
+        # than converting them to the angle and scale arguments of trbl().
+        key = (rq.w, rq.x, rq.y, rq.z, self.scale0.x, self.anchor.x, self.anchor.y, tx.width, tx.height)
+
+        if key != self._trbl_key:
+            self._trbl_key = key
+            self._trbl_value = trbl(
+                tx.width, 
+                tx.height, 
+                self.anchor.x * tx.width, 
+                self.anchor.y * tx.height, 
+                self.angle,
+                self.scale
+            )
+
+        return self._trbl_value
 
     def wrap_position(self, width, height, margin=50):
         """Wrap sprite's coordinates around given canvas width and height.
@@ -0,0 +1,33 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+from jupylet.audio.sound import PhaseModulator
+
+
+def test_phase_modulator_1d_signal():
+
+    pm = PhaseModulator(beta=2.)
+
+    carrier = np.linspace(-1, 1, 64, dtype='float32')[:, None]
+    signal = np.full(64, 0.5, dtype='float32')
+
+    a0 = pm.forward(carrier, signal)
+
+    assert a0.shape == carrier.shape
+    assert np.isfinite(a0).all()
+
+
+def test_phase_modulator_2d_signal():
+
+    pm = PhaseModulator(beta=2.)
+
+    carrier = np.linspace(-1, 1, 64, dtype='float32')[:, None]
+    signal = np.zeros((64, 1), dtype='float32')
+
+    a0 = pm.forward(carrier, signal)
+    a1 = pm.forward(carrier, signal)
+
+    assert a0.shape == carrier.shape
+    np.testing.assert_allclose(a1[3:], carrier[:-3])